@@ -1,39 +1,62 @@
 #!/usr/bin/env python
 import textwrap
 import click
-import glob
 import subprocess
-import time
+import threading
 import os
+import pickle
 import pluralizer
 import re
 
 from os.path import join as join_paths, isfile, dirname, basename, splitext
 
 from collections import defaultdict
+from dataclasses import dataclass
+from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
 from graphql import GraphQLSchema
 from watchdog.observers import Observer
-from watchdog.events import (
-    FileSystemEventHandler,
-    EVENT_TYPE_CREATED,
-    EVENT_TYPE_MODIFIED,
-)
+from watchdog.events import FileSystemEventHandler
 from gql.utils_codegen import CodeChunk
+from gql.utils_glob import translate_glob, iglob, literal_prefix
 
 from gql.config import Config
 from gql.query_parser import QueryParser, AnonymousQueryError, InvalidQueryError
 from gql.renderer_dataclasses import DataclassesRenderer
-from gql.utils_schema import load_schema
+from gql.schema_cache import load_cached_schema
+
+try:
+    import black
+except ImportError:
+    black = None
 
 DEFAULT_CONFIG_FNAME = ".gql.json"
 SCHEMA_PROMPT = click.style("Where is your schema?: ", fg="bright_white") + click.style(
     "(path or url) ", fg="bright_black", dim=False
 )
 
+CAMEL_CASE_BOUNDARY_RE = re.compile(r"([a-z0-9])([A-Z])")
+
+# Editors emit several events per save; changes within this window are processed once
+DEBOUNCE_SECONDS = 0.2
+
 ROOT_PROMPT = click.style(
     "Whats the root of your project: ", fg="bright_white"
 ) + click.style("(path or url) ", fg="bright_black", dim=False)
 
+# Last content written per output file, so unchanged files are not rewritten
+written_outputs = {}
+
+# Render result per query file, as (mtime, verb, result, error)
+rendered_queries = {}
+
+# Parser and renderer of a render_queries worker process
+worker_parser = None
+worker_renderer = None
+
 
 def safe_remove(fname):
     try:
@@ -81,25 +104,30 @@ def init(schema, endpoint, root, config_filename):
     )
 
 
-def process_files_with_same_domain(
-    filenames: list, parser: QueryParser, renderer: DataclassesRenderer
-):
-    def to_snake_case(camel_case_string):
-        # Use regular expression to identify capital letters and add underscores before them
-        snake_case_string = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", camel_case_string)
-        # Convert the entire string to lowercase
-        return snake_case_string.lower()
-
-    grouped_files = {
-        "app": {},
-        "packages": {},
-    }
-    for filename in filenames:
-        parts = filename.split("/")
-
-        del parts[0]
-
+def to_snake_case(camel_case_string):
+    # Add underscores before capital letters that follow a lowercase letter or digit
+    snake_case_string = CAMEL_CASE_BOUNDARY_RE.sub(r"\1_\2", camel_case_string)
+    # Convert the entire string to lowercase
+    return snake_case_string.lower()
+
+
+@dataclass
+class QueryFile:
+    full_path: str
+    parts: Tuple[str, ...]
+    name_of_the_file: str
+    name_of_the_function: str
+    verb: str
+    app_or_package: str
+    name_of_the_model: str
+    start_path: str
+
+    @classmethod
+    def from_path(cls, full_path: str) -> "QueryFile":
+        # parts are relative to the project root, i.e. start with "app" or "packages"
+        parts = tuple(full_path.split("/")[1:])
         name_of_the_file = parts[-1]
+        name_of_the_function = to_snake_case(name_of_the_file.split(".graphql")[0])
         app_or_package = parts[0]
 
         name_of_the_model = ""
@@ -107,22 +135,38 @@ def process_files_with_same_domain(
             name_of_the_model = parts[2]
         elif app_or_package == "packages":
             name_of_the_model = parts[1]
-            
-        if name_of_the_model not in grouped_files[app_or_package]:
-            grouped_files[app_or_package][name_of_the_model] = []
-            
-        grouped_files[app_or_package][name_of_the_model].append(
-            {
-                "full_path": filename,
-                "name_of_the_file": name_of_the_file,
-                "name_of_the_function": to_snake_case(
-                    name_of_the_file.split(".graphql")[0]
-                ),
-                "app_or_package": app_or_package,
-                "name_of_the_model": name_of_the_model,
-            }
+
+        return cls(
+            full_path=full_path,
+            parts=parts,
+            name_of_the_file=name_of_the_file,
+            name_of_the_function=name_of_the_function,
+            verb=name_of_the_function.split("_")[0],
+            app_or_package=app_or_package,
+            name_of_the_model=name_of_the_model,
+            start_path=os.path.normpath(os.path.join(full_path, "../..")),
         )
 
+
+def process_files_with_same_domain(
+    filenames: list,
+    parser: QueryParser,
+    renderer: DataclassesRenderer,
+    parallel: bool = True,
+):
+    grouped_files = {
+        "app": {},
+        "packages": {},
+    }
+    for filename in filenames:
+        item = QueryFile.from_path(filename)
+        models = grouped_files[item.app_or_package]
+
+        if item.name_of_the_model not in models:
+            models[item.name_of_the_model] = []
+
+        models[item.name_of_the_model].append(item)
+
     # key = Amazon, Shopify
     # items = tüm domainler
     # item = domain
@@ -130,7 +174,7 @@ def process_files_with_same_domain(
     for key, items in grouped_files["packages"].items(): 
         packages_data = {}
         for item in items:
-            needle = item["full_path"].split("/")[4] # domain ismi Product
+            needle = item.parts[3] # domain ismi Product
 
             if needle not in packages_data:
                 packages_data[needle] = []
@@ -138,24 +182,31 @@ def process_files_with_same_domain(
             packages_data[needle].append(item)
         grouped_files["packages"][key] = packages_data
 
+    render_queries(
+        [
+            (item.full_path, item.verb)
+            for item in items_of(grouped_files)
+        ],
+        parser,
+        renderer,
+        parallel=parallel,
+    )
+
     gathered_data = {}
+    written_files = []
 
     for key, models in grouped_files["app"].items():
         for item in models:
             filename, function = process_files_in_directory(
-                full_path=item["full_path"],
-                name_of_the_file=item["name_of_the_file"],
-                app_or_package=item["app_or_package"],
-                name_of_the_function=item["name_of_the_function"],
-                name_of_the_model=item["name_of_the_model"],
-                parser=parser,
+                query_file=item,
                 renderer=renderer,
+                written_files=written_files,
             )
 
             if key not in gathered_data:
                 gathered_data[key] = {
                     "domain_type": "app",
-                    "path": os.path.normpath(os.path.join(item["full_path"], "../..")),
+                    "path": item.start_path,
                     "functions": [],
                 }
 
@@ -170,22 +221,16 @@ def process_files_with_same_domain(
         for key, items in boks.items():
             for item in items:
                 filename, function = process_files_in_directory(
-                    full_path=item["full_path"],
-                    name_of_the_file=item["name_of_the_file"],
-                    app_or_package=item["app_or_package"],
-                    name_of_the_function=item["name_of_the_function"],
-                    name_of_the_model=item["name_of_the_model"],
-                    parser=parser,
+                    query_file=item,
                     renderer=renderer,
+                    written_files=written_files,
                 )
 
                 if parent_name + key not in gathered_data:
                     gathered_data[parent_name + key] = {
                         "domain_type": "packages",
                         "actual_name": key,
-                        "path": os.path.normpath(
-                            os.path.join(item["full_path"], "../..")
-                        ),
+                        "path": item.start_path,
                         "functions": [],
                     }
 
@@ -196,6 +241,10 @@ def process_files_with_same_domain(
                     }
                 )
 
+    # Without the Black package, format all generated files with a single Black run
+    if written_files and not black:
+        format_with_black(written_files)
+
     for name_of_the_model, item in gathered_data.items():
         create_init_file(
             name_of_the_model=name_of_the_model,
@@ -206,6 +255,15 @@ def process_files_with_same_domain(
         )
 
 
+def items_of(grouped_files: dict):
+    for items in grouped_files["app"].values():
+        yield from items
+
+    for domains in grouped_files["packages"].values():
+        for items in domains.values():
+            yield from items
+
+
 def create_init_file(
     name_of_the_model: str,
     directory: str,
@@ -218,77 +276,173 @@ def create_init_file(
     # List all files in the directory
     files_in_directory = os.listdir(directory)
 
+    lines = ["# pyright: reportUnusedImport=false"]
+
+    # Include additional functions specified in the functions list
+    for item in functions:
+        lines.append(f"from .executor.{item['filename']} import {item['function']}")
+
+    # Automatically include files at the same level
+    for file_name in files_in_directory:
+        if file_name.endswith(".py") and file_name != "__init__.py":
+            class_name = os.path.splitext(file_name)[0]
+            lines.append(f"from .{class_name} import {class_name}")
+
     # Create or overwrite the __init__.py file
-    with open(init_file_path, "w") as init_file:
-        init_file.write("# pyright: reportUnusedImport=false\n")
+    write_file(init_file_path, "\n".join(lines) + "\n")
 
-        # Include additional functions specified in the functions list
-        for item in functions:
-            init_file.write(
-                f"from .executor.{item['filename']} import {item['function']}\n"
-            )
 
-        # Automatically include files at the same level
-        for file_name in files_in_directory:
-            if file_name.endswith(".py") and file_name != "__init__.py":
-                class_name = os.path.splitext(file_name)[0]
-                init_file.write(f"from .{class_name} import {class_name}\n")
+def write_file(filename: str, content: str):
+    """Write `content` to `filename` with unbuffered os.write calls, normally just one."""
+    data = memoryview(content.encode("utf-8"))
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
 
 
 def process_files_in_directory(
-    full_path: str,
-    name_of_the_file: str,
-    app_or_package: str,
-    name_of_the_model: str,
-    name_of_the_function: str,
-    parser: QueryParser,
+    query_file: QueryFile,
     renderer: DataclassesRenderer,
+    written_files: list,
 ):
-    bare_file_name = "_".join(name_of_the_file.split(".")[:-1])
-    verb = name_of_the_function.split("_")[0]
-
-    domain_name = re.sub(r"(?<!^)(?=[A-Z])", "_", name_of_the_model).lower()
+    full_path = query_file.full_path
+    name_of_the_function = query_file.name_of_the_function
+    verb = query_file.verb
 
-    start_path = os.path.normpath(os.path.join(full_path, "../.."))
-    output_file = f"{start_path}/executor/{bare_file_name}.py"
+    bare_file_name = "_".join(query_file.name_of_the_file.split(".")[:-1])
+    output_file = f"{query_file.start_path}/executor/{bare_file_name}.py"
 
     buffer = CodeChunk()
     buffer.write(renderer.render_shared_code())
 
     click.echo(f"Parsing {full_path} ... ", nl=False)
 
-    with open(full_path, "r") as fin:
-        query = fin.read()
-        try:
-            parsed = parser.parse(query)
-            rendered = renderer.render(parsed, full_path, verb)
-
-            with buffer.write_block("def {}():".format(name_of_the_function)):
-                buffer.write("return {}, '{}'".format(verb, parsed.objects[0].name))
-
-            buffer.write(f"class {verb}:")
-            buffer.write("    " + rendered.replace("\n", "\n    "))
-            click.secho("Success!", fg="bright_white")
-        except AnonymousQueryError:
-            click.secho("Failed!", fg="bright_red")
-            click.secho("\tQuery is missing a name", fg="bright_black")
-        except InvalidQueryError as invalid_err:
-            click.secho("Failed!", fg="bright_red")
-            click.secho(f"\t{invalid_err}", fg="bright_black")
-
-    if len(buffer.lines) > 2:
+    _mtime, _verb, result, error = rendered_queries[full_path]
+    if error is None:
+        object_name, rendered = result
+
+        with buffer.write_block("def {}():".format(name_of_the_function)):
+            buffer.write("return {}, '{}'".format(verb, object_name))
+
+        buffer.write(f"class {verb}:")
+        buffer.write("    " + rendered.replace("\n", "\n    "))
+        click.secho("Success!", fg="bright_white")
+    else:
+        click.secho("Failed!", fg="bright_red")
+        click.secho(f"\t{error}", fg="bright_black")
+
+    if buffer.line_count > 2:
+        content = buffer.getvalue() + "\n"
+        if written_outputs.get(output_file) == content and isfile(output_file):
+            return bare_file_name, name_of_the_function
+
         os.makedirs(dirname(output_file), exist_ok=True)
-        with open(output_file, "w") as outfile:
-            for chunk in buffer.lines:
-                outfile.write(chunk)
-                outfile.write("\n")
+        write_file(output_file, format_source(output_file, content) if black else content)
 
-        # Format the output file using Black
-        format_with_black(output_file)
+        written_files.append(output_file)
+        written_outputs[output_file] = content
 
     return bare_file_name, name_of_the_function
 
 
+def render_queries(
+    jobs: list,
+    parser: QueryParser,
+    renderer: DataclassesRenderer,
+    parallel: bool = True,
+):
+    """Parse and render every `(full_path, verb)` job into `rendered_queries`.
+
+    Files whose mtime did not change since they were last rendered are served
+    from the cache; when several files are stale and `parallel` is set they are
+    rendered on worker processes.
+    """
+    stale = []
+    for full_path, verb in jobs:
+        mtime = os.stat(full_path).st_mtime_ns
+        cached = rendered_queries.get(full_path)
+        if cached is None or cached[:2] != (mtime, verb):
+            stale.append((full_path, verb, mtime))
+
+    # Reading is I/O bound, so several stale files are read on threads
+    filenames = [full_path for full_path, _verb, _mtime in stale]
+    if len(filenames) > 1:
+        with ThreadPoolExecutor(max_workers=min(32, len(filenames))) as executor:
+            queries = list(executor.map(read_query, filenames))
+    else:
+        queries = [read_query(full_path) for full_path in filenames]
+
+    jobs = [
+        (full_path, verb, query)
+        for (full_path, verb, _mtime), query in zip(stale, queries)
+    ]
+    results = None
+    if parallel and len(jobs) > 1:
+        results = render_in_pool(jobs, renderer)
+
+    if results is None:
+        results = [parse_and_render(parser, renderer, *job) for job in jobs]
+
+    for (full_path, verb, mtime), (result, error) in zip(stale, results):
+        rendered_queries[full_path] = (mtime, verb, result, error)
+
+
+def render_in_pool(jobs: list, renderer: DataclassesRenderer):
+    """Renders the jobs on worker processes, or returns None if the pool could not be started."""
+    with ProcessPoolExecutor(
+        max_workers=min(len(jobs), os.cpu_count() or 1),
+        initializer=init_worker,
+        initargs=(renderer.schema, renderer.config),
+    ) as executor:
+        try:
+            futures = [executor.submit(render_in_worker, job) for job in jobs]
+        except (pickle.PicklingError, AttributeError, TypeError):
+            # The schema could not be handed to the workers (e.g. it is not
+            # picklable under the "spawn" start method)
+            return None
+
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died before finishing, e.g. while initializing
+            return None
+
+
+def read_query(full_path: str) -> str:
+    return Path(full_path).read_bytes().decode()
+
+
+def init_worker(schema: GraphQLSchema, config: Config):
+    global worker_parser, worker_renderer
+
+    worker_parser = QueryParser(schema)
+    worker_renderer = DataclassesRenderer(schema, config)
+
+
+def render_in_worker(job: tuple):
+    return parse_and_render(worker_parser, worker_renderer, *job)
+
+
+def parse_and_render(
+    parser: QueryParser,
+    renderer: DataclassesRenderer,
+    full_path: str,
+    verb: str,
+    query: str,
+):
+    """Returns `((object_name, rendered), None)`, or `(None, error)` if the query is invalid."""
+    try:
+        parsed = parser.parse(query)
+        return (parsed.objects[0].name, renderer.render(parsed, full_path, verb)), None
+    except AnonymousQueryError:
+        return None, "Query is missing a name"
+    except InvalidQueryError as invalid_err:
+        return None, str(invalid_err)
+
+
 @cli.command()
 @click.option(
     "-c",
@@ -297,14 +451,19 @@ def process_files_in_directory(
     default=DEFAULT_CONFIG_FNAME,
     type=click.Path(exists=True),
 )
-def run(config_filename):
+@click.option(
+    "--refresh-schema",
+    is_flag=True,
+    help="Fetch the schema again instead of using the cached introspection.",
+)
+def run(config_filename, refresh_schema):
     if not isfile(config_filename):
         click.echo(f"Could not find configuration file {config_filename}")
 
     config = Config.load(config_filename)
-    schema = load_schema(config.schema)
+    schema = load_cached_schema(config.schema, refresh=refresh_schema)
 
-    filenames = glob.glob(config.documents, recursive=True)
+    filenames = list(iglob(config.documents))
 
     query_parser = QueryParser(schema)
     query_renderer = DataclassesRenderer(schema, config)
@@ -312,13 +471,44 @@ def run(config_filename):
     process_files_with_same_domain(filenames, query_parser, query_renderer)
 
 
-def format_with_black(filename):
-    """Format a Python file using Black."""
+@lru_cache()
+def black_mode():
+    """Builds the Black mode from the project's [tool.black] config, like the black CLI."""
+    pyproject = black.find_pyproject_toml((os.getcwd(),))
+    config = black.parse_pyproject_toml(pyproject) if pyproject else {}
+
+    target_versions = config.get("target_version", [])
+    if isinstance(target_versions, str):
+        target_versions = [target_versions]
+
+    return black.Mode(
+        target_versions={black.TargetVersion[v.upper()] for v in target_versions},
+        line_length=config.get("line_length", black.DEFAULT_LINE_LENGTH),
+        string_normalization=not config.get("skip_string_normalization", False),
+        magic_trailing_comma=not config.get("skip_magic_trailing_comma", False),
+        preview=config.get("preview", False),
+    )
+
+
+def format_source(filename: str, source: str) -> str:
+    """Format Python source in-process using Black."""
     try:
-        subprocess.run(["black", filename], check=True)
+        formatted = black.format_str(source, mode=black_mode())
         click.echo(f"Formatted {filename} with Black.")
-    except subprocess.CalledProcessError as e:
+        return formatted
+    except black.InvalidInput as e:
         click.echo(f"Error formatting {filename} with Black: {e}")
+        return source
+
+
+def format_with_black(filenames: list):
+    """Format Python files using a single Black run."""
+    try:
+        subprocess.run(["black", *filenames], check=True)
+        for filename in filenames:
+            click.echo(f"Formatted {filename} with Black.")
+    except subprocess.CalledProcessError as e:
+        click.echo(f"Error formatting {' '.join(filenames)} with Black: {e}")
 
 
 @cli.command()
@@ -329,46 +519,105 @@ def format_with_black(filename):
     default=DEFAULT_CONFIG_FNAME,
     type=click.Path(exists=True),
 )
-def watch(config_filename):
+@click.option(
+    "--refresh-schema",
+    is_flag=True,
+    help="Fetch the schema again instead of using the cached introspection.",
+)
+def watch(config_filename, refresh_schema):
     class Handler(FileSystemEventHandler):
         def __init__(self, config: Config, schema: GraphQLSchema):
             self.parser = QueryParser(schema)
             self.renderer = DataclassesRenderer(schema, config)
+            self.pattern = translate_glob(os.path.abspath(config.documents))
+            self.filenames = {
+                os.path.abspath(fn)
+                for fn in iglob(config.documents)
+            }
+            self.lock = threading.Lock()
+            # Serializes regenerations, which share the module-level caches
+            self.processing = threading.Lock()
+            self.timer = None
 
-        def on_any_event(self, event):
-            if event.is_directory:
+        def on_created(self, event):
+            if event.is_directory or not self.pattern.match(event.src_path):
                 return
 
-            if event.event_type in {EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED}:
-                filenames = [
-                    os.path.abspath(fn)
-                    for fn in glob.iglob(config.documents, recursive=True)
-                ]
-                if event.src_path not in filenames:
-                    return
+            with self.lock:
+                self.filenames.add(event.src_path)
+            self.schedule()
 
-                process_files_with_same_domain(filenames, self.parser, self.renderer)
+        def on_deleted(self, event):
+            self.forget(event)
+
+        def on_moved(self, event):
+            self.forget(event)
+            if event.is_directory or not self.pattern.match(event.dest_path):
+                return
+
+            with self.lock:
+                self.filenames.add(event.dest_path)
+            self.schedule()
+
+        def on_modified(self, event):
+            if event.is_directory or event.src_path not in self.filenames:
+                return
+
+            self.schedule()
+
+        def forget(self, event):
+            with self.lock:
+                if event.is_directory:
+                    prefix = event.src_path + os.sep
+                    self.filenames = {
+                        fn for fn in self.filenames if not fn.startswith(prefix)
+                    }
+                else:
+                    self.filenames.discard(event.src_path)
+
+        def schedule(self):
+            with self.lock:
+                if self.timer:
+                    self.timer.cancel()
+
+                self.timer = threading.Timer(DEBOUNCE_SECONDS, self.process)
+                self.timer.start()
+
+        def process(self):
+            with self.processing:
+                with self.lock:
+                    if self.timer is threading.current_thread():
+                        self.timer = None
+                    filenames = sorted(self.filenames)
+
+                # The observer's threads are running, so forking a process pool
+                # here could deadlock; render in this process instead
+                process_files_with_same_domain(
+                    filenames, self.parser, self.renderer, parallel=False
+                )
 
     if not isfile(config_filename):
         click.echo(f"Could not find configuration file {config_filename}")
 
     config = Config.load(config_filename)
-    schema = load_schema(config.schema)
+    schema = load_cached_schema(config.schema, refresh=refresh_schema)
 
     click.secho(f"Watching {config.documents}", fg="cyan")
     click.secho("Ready for changes...", fg="cyan")
 
+    # Only watch the directories the documents pattern can match in
+    watched_path = os.path.abspath(literal_prefix(config.documents) or "./")
+    if not os.path.isdir(watched_path):
+        watched_path = os.path.abspath("./")
+
     observer = Observer()
-    observer.schedule(Handler(config, schema), os.path.abspath("./"), recursive=True)
+    observer.schedule(Handler(config, schema), watched_path, recursive=True)
     observer.start()
     try:
-        while True:
-            time.sleep(5)
-    except:
+        observer.join()
+    except KeyboardInterrupt:
         observer.stop()
-        print("Error")
-
-    observer.join()
+        observer.join()
 
 
 if __name__ == "__main__":
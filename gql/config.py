@@ -12,6 +12,8 @@ class Config:
     endpoint: str
     documents: str
     custom_header: str = ''
+    # Slotted dataclasses need Python 3.10+ wherever the generated code runs
+    dataclass_slots: bool = False
 
     @classmethod
     def load(cls: Type[ConfigT], filename: str) -> ConfigT:
@@ -12,11 +12,62 @@ from gql.query_parser import (
     ParsedOperation,
 )
 import textwrap
+from itertools import chain
 from typing import List
 
+# Field types rendered as-is, without a verb-qualified forward reference
+PLAIN_FIELD_TYPES = frozenset({"str", "int", "bool"})
+
+# Field types that never need to be renamed to stay unique
+SCALAR_FIELD_TYPES = frozenset(
+    {"str", "int", "bool", "date", "datetime", "DateTime", "numeric"}
+)
+
+DATETIME_FIELD_SUFFIX = """= field(
+                    default=None,
+                    metadata=config(
+                        encoder=datetime_encoder,
+                        decoder=datetime_decoder,
+                        mm_field=marshmallow_fields.DateTime(format="iso"),
+                    ),
+                )"""
+
+# Rendered (type, suffix, is_optional) of field types that are mapped to another type
+FIELD_TYPE_RULES = {
+    "json": ("Dict", "", False),
+    "DateTime": ("datetime", DATETIME_FIELD_SUFFIX, True),
+    "numeric": ("float", "", False),
+}
+
+KEYWORD_AND_INSIDE_BRACKETS_RE = re.compile(r"(\w+)\[(.*?)\]")
+NESTED_TYPE_RE = re.compile(r"(.*)\[(.*)\]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Prologue shared by every generated module; it does not depend on the query
+SHARED_CODE = textwrap.dedent(
+    """
+    # AUTOGENERATED file. Do not Change!
+    import re
+    from functools import partial
+    from typing import Any, Callable, Mapping, List, Optional, Dict
+    from dataclasses import dataclass, field
+    from dataclasses_json import dataclass_json, config
+    from dateutil import parser
+    from datetime import datetime
+    from marshmallow import fields as marshmallow_fields
+    from app.klasses import Executor
+
+    def datetime_encoder(dt: datetime) -> str:
+        return dt.isoformat() if dt else None
+
+    def datetime_decoder(dt_str: str) -> Optional[datetime]:
+        return parser.parse(dt_str) if dt_str else None
+    """
+)
+
 
 def dedent(text):
-    return re.sub(r"\s+", " ", text).strip()
+    return WHITESPACE_RE.sub(" ", text).strip()
 
 
 class DataclassesRenderer:
@@ -25,32 +76,7 @@ class DataclassesRenderer:
         self.config = config
 
     def render_shared_code(self):
-        buffer = CodeChunk()
-
-        buffer.write(
-            textwrap.dedent(
-                """
-                    # AUTOGENERATED file. Do not Change!
-                    import re
-                    from functools import partial
-                    from typing import Any, Callable, Mapping, List, Optional, Dict
-                    from dataclasses import dataclass, field
-                    from dataclasses_json import dataclass_json, config
-                    from dateutil import parser
-                    from datetime import datetime
-                    from marshmallow import fields as marshmallow_fields
-                    from app.klasses import Executor
-                    
-                    def datetime_encoder(dt: datetime) -> str:
-                        return dt.isoformat() if dt else None
-
-                    def datetime_decoder(dt_str: str) -> Optional[datetime]:
-                        return parser.parse(dt_str) if dt_str else None
-            """
-            )
-        )
-
-        return str(buffer)
+        return SHARED_CODE
 
     def render(self, parsed_query: ParsedQuery, full_path: str, verb: str):
         buffer = CodeChunk()
@@ -108,14 +134,16 @@ class DataclassesRenderer:
     def render_object(self, obj: ParsedObject, verb: str):
         buffer = CodeChunk()
 
+        # Response objects are created per node, so they are slotted (no per-instance __dict__)
+        # when the project opted in, as slots=True needs Python 3.10+ at import
         buffer.write("@dataclass_json")
-        buffer.write("@dataclass")
+        buffer.write("@dataclass(slots=True)" if self.config.dataclass_slots else "@dataclass")
 
-        # render fields
-        sorted_fields = sorted(
-            obj.fields,
-            key=lambda f: (f.type == "DateTime", f.nullable),
-        )
+        # render fields: non-DateTime before DateTime, non-nullable before nullable
+        buckets = ([], [], [], [])
+        for field in obj.fields:
+            buckets[(field.type == "DateTime") * 2 + bool(field.nullable)].append(field)
+        sorted_fields = chain.from_iterable(buckets)
 
         with buffer.write_block(f"class {obj.name}:"):
             for field in sorted_fields:
@@ -154,18 +182,9 @@ class DataclassesRenderer:
             buffer.write(f"__NAME__ = '{query_name}'")
             buffer.write(f"__QUERY__ = '{dedent(query_string)}'")
 
-            # Execution functions
-            vars_args_list = [f"{var.name}=None" for var in operation_variables]
-            vars_args_str = ", ".join(vars_args_list)
-            if vars_args_str:
-                vars_args_str += ", "
-
-            variables_dict_lines = []
-            for x in operation_variables:
-                variables_dict_lines.append(f"'{x.name}'")
-
-            variables_dict_str = ", ".join(variables_dict_lines)
-            buffer.write(f"__PARAMS__ = [{variables_dict_str}]")
+            # Variable names; Executor builds the variables mapping from them
+            params_str = ", ".join(f"'{var.name}'" for var in operation_variables)
+            buffer.write(f"__PARAMS__ = [{params_str}]")
 
             # anan = query_name.replace("find", "").replace("get", "")
             # singular_str = anan[:-1] if anan.endswith("s") else anan
@@ -181,66 +200,19 @@ class DataclassesRenderer:
 
     @staticmethod
     def render_field(field: ParsedField, verb: str):
-        def render_json_type(field_type: str) -> str:
-            """Transforms JSON type fields to Dict."""
-            return "Dict" if field_type == "json" else field_type
-
-        def handle_nullable_field(field: ParsedField) -> (str, bool):
-            """Handles nullable fields by setting the appropriate suffix and optionality."""
-            is_optional = False
-            suffix = ""
-            if field.nullable:
-                if field.name != "organization":
-                    is_optional = True
-                    suffix = f"= {field.default_value}"
-            return suffix, is_optional
-
-        def handle_datetime_type(field_type: str) -> (str, str, bool):
-            """Handles DateTime type fields by setting the appropriate suffix and type."""
-            is_optional = False
-            suffix = ""
-            if field_type == "DateTime":
-                is_optional = True
-                suffix = """= field(
-                    default=None,
-                    metadata=config(
-                        encoder=datetime_encoder,
-                        decoder=datetime_decoder,
-                        mm_field=marshmallow_fields.DateTime(format="iso"),
-                    ),
-                )"""
-                field_type = "datetime"
-            return suffix, field_type, is_optional
-
-        def handle_numeric_type(field_type: str) -> str:
-            """Transforms numeric type fields to float."""
-            return "float" if field_type == "numeric" else field_type
-
-        def extract_keyword_and_inside_brackets(text: str):
-            # Use regex to find a keyword and content inside brackets
-            match = re.search(r"(\w+)\[(.*?)\]", text)
-            if match:
-                return match.group(1), match.group(
-                    2
-                )  # Return the keyword and the content inside brackets
-            return None
-
-        suffix = ""
-        field_type = field.type
-
-        # Call transformation methods
-        field_type = render_json_type(field_type)
-        suffix, is_optional = handle_nullable_field(field)
-        suffix, field_type, is_optional = handle_datetime_type(field_type)
-        field_type = handle_numeric_type(field_type)
-
-        # Check if no transformation was applied
-        if field_type == field.type and field_type not in ["str", "int", "bool"]:
-            if "[" in field_type:
-                sub_parts = extract_keyword_and_inside_brackets(field_type)
-                field_type = f"{sub_parts[0]}['{verb}.{sub_parts[1]}']"
-            else:
-                field_type = f"'{verb}.{field_type}'"
+        suffix, is_optional = "", False
+
+        rule = FIELD_TYPE_RULES.get(field.type)
+        if rule:
+            field_type, suffix, is_optional = rule
+        elif field.type in PLAIN_FIELD_TYPES:
+            field_type = field.type
+        elif "[" in field.type:
+            # Qualify the type inside the brackets, e.g. List['verb.item']
+            match = KEYWORD_AND_INSIDE_BRACKETS_RE.search(field.type)
+            field_type = f"{match.group(1)}['{verb}.{match.group(2)}']"
+        else:
+            field_type = f"'{verb}.{field.type}'"
 
         # Determine if the field type is optional
         if is_optional:
@@ -254,7 +226,7 @@ class DataclassesRenderer:
 
         def unique_name(name, count_dict):
             # Handle nested types like List[amazon_product_image]
-            nested_type_match = re.match(r"(.*)\[(.*)\]", name)
+            nested_type_match = NESTED_TYPE_RE.match(name)
             if nested_type_match:
                 outer_type, inner_type = nested_type_match.groups()
                 # Recursively apply unique_name to the inner type
@@ -279,15 +251,7 @@ class DataclassesRenderer:
             # Process each field to ensure the type is unique
             if hasattr(parsed_object, "fields"):
                 for field in parsed_object.fields:
-                    if field.type in [
-                        "str",
-                        "int",
-                        "bool",
-                        "date",
-                        "datetime",
-                        "DateTime",
-                        "numeric",
-                    ]:
+                    if field.type in SCALAR_FIELD_TYPES:
                         continue
                     field.type = unique_name(field.type, type_count)
 
@@ -0,0 +1,44 @@
+import os
+import json
+import time
+import hashlib
+from graphql import GraphQLSchema, build_client_schema
+from gql.utils_schema import load_schema, load_introspection_from_server
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'gql')
+
+# Endpoints don't version their schema, so cached introspections simply expire
+SCHEMA_CACHE_TTL = 60 * 60
+
+
+def load_cached_schema(uri, refresh=False) -> GraphQLSchema:
+    """Loads the schema, reusing a remote introspection fetched less than SCHEMA_CACHE_TTL
+    seconds ago unless `refresh` is set."""
+    # Local introspection files are already as cheap to read as a cache entry
+    if os.path.isfile(uri):
+        return load_schema(uri)
+
+    cache_file = os.path.join(CACHE_DIR, hashlib.sha256(uri.encode()).hexdigest() + '.json')
+    if not refresh:
+        try:
+            if time.time() - os.stat(cache_file).st_mtime < SCHEMA_CACHE_TTL:
+                with open(cache_file, 'r') as fin:
+                    return build_client_schema(json.load(fin))
+        except Exception:
+            # Missing or unreadable cache entries are rebuilt below
+            pass
+
+    introspection = load_introspection_from_server(uri)
+    tmp_file = cache_file + '.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_file, 'w') as outfile:
+            json.dump(introspection, outfile)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+    return build_client_schema(introspection)
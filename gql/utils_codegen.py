@@ -1,3 +1,4 @@
+import io
 import os
 
 SPACES = ' ' * 4
@@ -16,7 +17,8 @@ class CodeChunk:
             self.gen.unindent()
 
     def __init__(self):
-        self.lines = []
+        self.buffer = io.StringIO()
+        self.line_count = 0
         self.level = 0
 
     def indent(self):
@@ -35,11 +37,17 @@ class CodeChunk:
         if args or kwargs:
             value = value.format(*args, **kwargs)
 
-        self.lines.append(value)
+        self.append(value)
 
     def write_lines(self, lines):
         for line in lines:
-            self.lines.append(self.indent_string + line)
+            self.append(self.indent_string + line)
+
+    def append(self, line: str):
+        if self.line_count:
+            self.buffer.write(os.linesep)
+        self.buffer.write(line)
+        self.line_count += 1
 
     def block(self):
         return self.Block(self)
@@ -48,5 +56,8 @@ class CodeChunk:
         self.write(block_header, *args, **kwargs)
         return self.block()
 
+    def getvalue(self):
+        return self.buffer.getvalue()
+
     def __str__(self):
-        return os.linesep.join(self.lines)
+        return self.getvalue()
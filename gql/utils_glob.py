@@ -0,0 +1,130 @@
+import os
+import re
+
+
+SEP = re.escape(os.sep)
+
+# A name that glob's wildcards can match; like glob, hidden names are never matched by them
+VISIBLE_NAME = rf'(?!\.)[^{SEP}]+'
+
+
+def translate_glob(pattern: str):
+    """Compiles a recursive glob pattern (as accepted by glob.glob(..., recursive=True)) into a regex."""
+    components = pattern.split(os.sep)
+    parts = []
+    for index, component in enumerate(components):
+        last = index == len(components) - 1
+        if component == '**':
+            # Any number of visible directories, or any visible path when last
+            if last:
+                parts.append(f'(?:{VISIBLE_NAME}(?:{SEP}{VISIBLE_NAME})*)?')
+            else:
+                parts.append(f'(?:{VISIBLE_NAME}{SEP})*')
+            continue
+
+        parts.append(translate_component(component))
+        if not last:
+            parts.append(SEP)
+
+    return re.compile(''.join(parts) + r'\Z')
+
+
+def translate_component(component: str):
+    if not has_magic(component):
+        return re.escape(component)
+
+    # Wildcards only match a leading '.' when the pattern spells it out
+    parts = [] if component.startswith('.') else [r'(?!\.)']
+    i, n = 0, len(component)
+    while i < n:
+        char = component[i]
+        i += 1
+        if char == '*':
+            parts.append(f'[^{SEP}]*')
+        elif char == '?':
+            parts.append(f'[^{SEP}]')
+        elif char == '[':
+            # Character class, handled like fnmatch.translate does
+            j = i
+            if j < n and component[j] == '!':
+                j += 1
+            if j < n and component[j] == ']':
+                j += 1
+            while j < n and component[j] != ']':
+                j += 1
+
+            if j >= n:
+                parts.append(re.escape(char))
+                continue
+
+            stuff = component[i:j].replace('\\', '\\\\')
+            i = j + 1
+            if stuff[0] == '!':
+                stuff = f'^{SEP}' + stuff[1:]
+            elif stuff[0] in '^[':
+                stuff = '\\' + stuff
+            parts.append(f'[{stuff}]')
+        else:
+            parts.append(re.escape(char))
+
+    return ''.join(parts)
+
+
+def has_magic(part: str):
+    return any(char in part for char in '*?[')
+
+
+def literal_prefix(pattern: str):
+    """Returns the leading directories of a glob pattern that contain no wildcards."""
+    parts = pattern.split(os.sep)
+    literal = []
+    for part in parts[:-1]:
+        if has_magic(part):
+            break
+        literal.append(part)
+
+    prefix = os.sep.join(literal)
+    if not prefix and pattern.startswith(os.sep):
+        return os.sep
+    return prefix
+
+
+def iglob(pattern: str):
+    """Like glob.iglob(pattern, recursive=True) for files, but only reads the directories
+    below the pattern's literal prefix, pruning by depth when the pattern has no '**'."""
+    prefix = literal_prefix(pattern)
+    regex = translate_glob(pattern)
+
+    remaining = pattern[len(prefix):].lstrip(os.sep).split(os.sep)
+    max_depth = None if '**' in remaining else len(remaining) - 1
+
+    # Hidden entries can only match components that start with a '.'
+    skip_hidden = not any(
+        part.startswith('.') and part not in ('.', '..') for part in remaining
+    )
+
+    def walk(directory, depth):
+        try:
+            entries = os.scandir(directory or os.curdir)
+        except OSError:
+            return
+
+        with entries:
+            for entry in entries:
+                if skip_hidden and entry.name.startswith('.'):
+                    continue
+
+                path = os.path.join(directory, entry.name) if directory else entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    # Symlink loops and unreadable entries, like glob does
+                    is_dir = False
+
+                if is_dir:
+                    if max_depth is None or depth < max_depth:
+                        yield from walk(path, depth + 1)
+                elif regex.match(path):
+                    yield path
+
+    yield from walk(prefix, 0)
@@ -1,14 +1,17 @@
 import os
 import json
 import requests
+from functools import lru_cache
 from graphql import get_introspection_query, build_client_schema
 
+INTROSPECTION_HEADERS = {
+    "x-hasura-admin-secret": ".Cemre94.",
+}
+
 
 def load_introspection_from_server(url):
     query = get_introspection_query()
-    request = requests.post(url, json={'query': query}, headers={
-        "x-hasura-admin-secret": ".Cemre94.",
-    })
+    request = requests.post(url, json={'query': query}, headers=INTROSPECTION_HEADERS)
     if request.status_code == 200:
         return request.json()['data']
 
@@ -20,6 +23,7 @@ def load_introspection_from_file(filename):
         return json.load(fin)
 
 
+@lru_cache()
 def load_schema(uri):
     introspection = load_introspection_from_file(uri) if os.path.isfile(uri) else load_introspection_from_server(uri)
     return build_client_schema(introspection)
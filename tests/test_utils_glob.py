@@ -0,0 +1,83 @@
+import glob
+import os
+
+import pytest
+
+from gql.utils_glob import iglob, translate_glob
+
+FILES = [
+    'src/app/a.graphql',
+    'src/app/d1/a1.graphql',
+    'src/app/d2/a1.graphql',
+    'src/app/d2/b1.graphql',
+    'src/app/d2/c1.graphql',
+    'src/app/d3/deep/x.graphql',
+    'src/app/d3/deep/x.txt',
+    'src/app/.#lock.graphql',
+    'src/app/.hidden/h.graphql',
+    'src/app/d2/.dot.graphql',
+]
+
+PATTERNS = [
+    'src/app/**/*.graphql',
+    './src/app/**/*.graphql',
+    '**/*.graphql',
+    'src/app/*.graphql',
+    'src/app/*/*.graphql',
+    'src/app/d?/*.graphql',
+    'src/app/d[12]/*.graphql',
+    'src/app/d2/[ab]1.graphql',
+    'src/app/d2/[!ab]1.graphql',
+    'src/app/d[!3]/**/*.graphql',
+    'src/app/**',
+    'src/app/.*.graphql',
+    'src/app/*/.*.graphql',
+    'src/app/.hidden/*.graphql',
+    'src/app/d1/a1.graphql',
+    'src/app/missing/*.graphql',
+]
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    for name in FILES:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+def test_iglob_matches_glob(tree, pattern):
+    expected = [path for path in glob.glob(pattern, recursive=True) if not os.path.isdir(path)]
+    assert sorted(iglob(pattern)) == sorted(expected)
+
+
+def test_iglob_absolute_pattern(tree):
+    pattern = os.path.join(str(tree), 'src', 'app', '**', '*.graphql')
+    assert sorted(iglob(pattern)) == sorted(glob.glob(pattern, recursive=True))
+
+
+@pytest.mark.parametrize('path, matches', [
+    ('/w/src/app/a.graphql', True),
+    ('/w/src/app/x/y/a.graphql', True),
+    ('/w/src/app/.#findX.graphql', False),
+    ('/w/src/app/.hidden/a.graphql', False),
+    ('/w/src/app/a.graphqlx', False),
+    ('/w/src/appx/a.graphql', False),
+])
+def test_translate_glob_skips_hidden_names(path, matches):
+    assert bool(translate_glob('/w/src/app/**/*.graphql').match(path)) == matches
+
+
+def test_iglob_survives_symlink_loops(tmp_path, monkeypatch):
+    (tmp_path / 'q' / 'a').mkdir(parents=True)
+    (tmp_path / 'q' / 'a' / 'x.graphql').write_text('')
+    (tmp_path / 'q' / 'a' / 'loop').symlink_to('..')
+    monkeypatch.chdir(tmp_path)
+
+    pattern = 'q/**/*.graphql'
+    expected = [path for path in glob.glob(pattern, recursive=True) if not os.path.isdir(path)]
+    assert sorted(iglob(pattern)) == sorted(expected)